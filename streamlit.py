@@ -2,27 +2,83 @@
 
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-from neo4j import GraphDatabase
-from pyvis.network import Network
+import numpy as np
 import streamlit.components.v1 as components
-import tempfile
 import os
+import logging
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
 
 # === Neo4j Setup ===
 database_name = "neo4j"
 username = "neo4j"
 password = "apan5400"  # Update if necessary
-uri = "bolt://localhost:7687/" + database_name
+uri = os.getenv("NEO4J_URI", "neo4j://localhost:7687")  # neo4j:// enables client-side routing
+max_pool_size = int(os.getenv("NEO4J_MAX_POOL_SIZE", "50"))
+
+# Optional local Parquet snapshot of the Neo4j data for faster cold starts.
+# The snapshot is not refreshed from Neo4j: delete the file to pick up new data.
+# The schema version is part of the filename so snapshots from older layouts are ignored.
+snapshot_version = 1
+snapshot_path = os.getenv("NCI_SNAPSHOT_PATH")
+if snapshot_path:
+    snapshot_root, snapshot_ext = os.path.splitext(snapshot_path)
+    snapshot_path = f"{snapshot_root}.v{snapshot_version}{snapshot_ext or '.parquet'}"
 
-driver = GraphDatabase.driver(uri, auth=(username, password))
-session = driver.session()
+# === Shared Neo4j driver (reused across reruns) ===
+@st.cache_resource
+def get_driver():
+    from neo4j import GraphDatabase
 
+    driver = GraphDatabase.driver(
+        uri,
+        auth=(username, password),
+        max_connection_pool_size=max_pool_size,
+        connection_acquisition_timeout=30,
+        max_transaction_retry_time=15,
+        keep_alive=True
+    )
+    # Runs once per process since the driver is cached
+    driver.verify_connectivity()
+    return driver
+
+get_driver()
 st.success("✅ Successfully connected to Neo4j!")
 
+# === Read helper: managed read transaction (with driver retries) returning a DataFrame ===
+def run_read_query(query, fetch_size=1000, **params):
+    with get_driver().session(database=database_name, fetch_size=fetch_size) as session:
+        return session.execute_read(lambda tx: tx.run(query, **params).to_df())
+
 # === Function to load data from Neo4j instead of CSV ===
+data_columns = ['Incident_zip', 'Complaint_type', 'Borough', 'count', 'Created_date']
+
+# Shared dtype normalization for both the Neo4j and the snapshot load paths
+def normalize_complaint_data(df):
+    # Fill missing Boroughs if any
+    df['Borough'] = df['Borough'].fillna('UNKNOWN')
+
+    # Categorical codes make filtering and counting cheap integer operations
+    for col in ['Incident_zip', 'Complaint_type', 'Borough']:
+        df[col] = df[col].astype('category')
+    df['count'] = pd.to_numeric(df['count'], downcast='integer')
+    return df
+
 @st.cache_data
 def load_data_from_neo4j():
+    if snapshot_path and os.path.exists(snapshot_path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        # A truncated or unreadable snapshot falls through to Neo4j, which rewrites it
+        try:
+            table = pq.read_table(snapshot_path, memory_map=True, columns=data_columns)
+            return normalize_complaint_data(table.to_pandas())
+        except (pa.ArrowInvalid, OSError):
+            logger.warning("Ignoring unreadable snapshot %s", snapshot_path, exc_info=True)
+
     query = """
     MATCH (z:Zip)-[r:HAS_COMPLAINT]->(c:ComplaintType)
     OPTIONAL MATCH (z)-[:LOCATED_IN]->(b:Borough)
@@ -31,50 +87,187 @@ def load_data_from_neo4j():
            b.name AS Borough,
            r.count AS count
     """
-    with session.begin_transaction() as tx:
-        result = tx.run(query)
-        records = result.data()
-    df = pd.DataFrame(records)
-    
-    # Fill missing Boroughs if any
-    df['Borough'] = df['Borough'].fillna('UNKNOWN')
+    df = normalize_complaint_data(run_read_query(query))
     
     # Create dummy Created_date for testing trend if needed
     df['Created_date'] = pd.date_range(start='2023-01-01', periods=len(df), freq='D')
 
+    if snapshot_path:
+        # The snapshot is optional: a failed write is logged and the live data is still returned
+        # Written to a per-process temp file and renamed, so readers and concurrent writers never see a partial file
+        tmp_path = f"{snapshot_path}.{os.getpid()}.tmp"
+        try:
+            df.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, snapshot_path)
+        except OSError:
+            logger.warning("Could not write snapshot %s", snapshot_path, exc_info=True)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
     return df
 
 df = load_data_from_neo4j()
 
-# === Function to get network graph data ===
-def get_zip_graph_data(selected_zip):
+# === Per-ZIP slices and overall borough totals, built once per process ===
+@st.cache_resource
+def get_zip_groups(_df):
+    return {zip_code: group for zip_code, group in _df.groupby('Incident_zip', observed=True, sort=False)}
+
+# value_counts for categoricals as a bincount over the integer codes; keeps only observed categories
+def category_counts(series, name):
+    codes = series.cat.codes.to_numpy()
+    counts = np.bincount(codes[codes >= 0], minlength=len(series.cat.categories))
+    order = np.argsort(-counts, kind='stable')
+    order = order[counts[order] > 0]
+    return pd.DataFrame({name: series.cat.categories.to_numpy()[order], 'Count': counts[order]})
+
+@st.cache_resource
+def get_borough_counts(_df):
+    return category_counts(_df['Borough'], 'Borough')
+
+@st.cache_resource
+def get_zip_codes(_df):
+    return sorted(_df['Incident_zip'].dropna().unique().tolist())
+
+@st.cache_resource
+def weekly_by_zip(_df):
+    # Same week-ending-Sunday buckets as resample('W'), one column per ZIP
+    week = _df['Created_date'].dt.to_period('W').dt.end_time.dt.normalize()
+    weekly = _df.assign(week=week).groupby(['Incident_zip', 'week'], observed=True).size().unstack(0, fill_value=0)
+    if weekly.empty:
+        return weekly
+    # Keep weeks with no data anywhere as zero rows, as resample('W') does
+    return weekly.reindex(pd.date_range(weekly.index.min(), weekly.index.max(), freq='W-SUN'), fill_value=0)
+
+zip_groups = get_zip_groups(df)
+
+# === Per-ZIP complaint edges from Neo4j: one round trip feeds counts and graph (cached per ZIP) ===
+@st.cache_data(ttl=600, show_spinner=False)
+def get_zip_complaints(selected_zip):
     query = """
     MATCH (z:Zip {code: $zip})-[r:HAS_COMPLAINT]->(c:ComplaintType)
-    RETURN z.code AS zip, c.name AS complaint, r.count AS count
+    RETURN z.code AS zip, c.type AS complaint_type, c.name AS complaint, r.count AS count
     ORDER BY count DESC
     """
-    with session.begin_transaction() as tx:
-        result = tx.run(query, zip=selected_zip)
-        return [(record["zip"], record["complaint"], record["count"]) for record in result]
+    return run_read_query(query, zip=selected_zip)
+
+@st.cache_data(ttl=600, show_spinner=False)
+def get_complaint_counts(selected_zip):
+    edges = get_zip_complaints(selected_zip)
+    if edges.empty:
+        return pd.DataFrame({'Complaint Type': [], 'Count': []})
+    complaint_counts = edges.groupby('complaint_type', sort=False)['count'].sum().sort_values(ascending=False).reset_index()
+    complaint_counts.columns = ['Complaint Type', 'Count']
+    return complaint_counts
+
+@st.cache_data(ttl=600, show_spinner=False)
+def get_borough_breakdown(selected_zip):
+    query = """
+    MATCH (z:Zip {code: $zip})-[r:HAS_COMPLAINT]->(c:ComplaintType)
+    OPTIONAL MATCH (z)-[:LOCATED_IN]->(b:Borough)
+    RETURN coalesce(b.name, 'UNKNOWN') AS Borough,
+           c.type AS Complaint_type,
+           sum(r.count) AS count
+    """
+    return run_read_query(query, zip=selected_zip)
+
+# === Function to get network graph data (cached per ZIP) ===
+@st.cache_data(ttl=600, show_spinner=False)
+def get_zip_graph_data(selected_zip):
+    edges = get_zip_complaints(selected_zip)
+    if edges.empty:
+        return ()
+    return tuple(edges[['zip', 'complaint', 'count']].itertuples(index=False, name=None))
+
+# === Warm the per-ZIP caches for the busiest ZIPs in the background ===
+def warm_zip_caches(zip_code):
+    # Prefetching is optional, so a failing ZIP is logged rather than surfaced to the page
+    try:
+        get_zip_complaints(zip_code)
+        get_borough_breakdown(zip_code)
+    except Exception:
+        logger.warning("Prefetch failed for ZIP %s", zip_code, exc_info=True)
+
+# Expires together with the query caches it fills, so the next rerun after that warms them again
+@st.cache_resource(ttl=600, show_spinner=False)
+def prefetch_top_zips(_df, n=10):
+    top_zips = _df.groupby('Incident_zip', observed=True)['count'].sum().nlargest(n).index.tolist()
+    # Each worker opens its own session inside run_read_query; the driver itself is thread-safe.
+    # shutdown(wait=False) lets the page render while the queries run.
+    pool = ThreadPoolExecutor(max_workers=min(n, max_pool_size))
+    for zip_code in top_zips:
+        pool.submit(warm_zip_caches, zip_code)
+    pool.shutdown(wait=False)
+    return top_zips
+
+prefetch_top_zips(df)
+
+# === Function to render the pyvis network graph to HTML (cached per ZIP) ===
+@st.cache_data(show_spinner=False)
+def build_graph_html(selected_zip, graph_data):
+    from pyvis.network import Network
+
+    g = Network(height="400px", width="100%", notebook=False)
+    g.add_node(selected_zip, label=f"ZIP: {selected_zip}", color="blue")
+    for zip_code, complaint_type, count in graph_data:
+        g.add_node(complaint_type, label=complaint_type, color="orange")
+        g.add_edge(zip_code, complaint_type, value=count, title=f"{count} complaints")
+    return g.generate_html(notebook=False)
+
+# === Filtered CSV export (cached per ZIP) ===
+@st.cache_data(show_spinner=False)
+def to_csv_bytes(selected_zip):
+    return zip_groups[selected_zip].to_csv(index=False).encode("utf-8")
+
+# === Largest-Triangle-Three-Buckets downsampling for line charts ===
+def lttb_downsample(x, y, n_out=2000):
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    # First and last points are always kept; the rest are split into buckets
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    selected = np.empty(n_out, dtype=int)
+    selected[0] = 0
+    selected[-1] = n - 1
+
+    prev = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        # Pick the point forming the largest triangle with the previous pick and next bucket average
+        area = np.abs(
+            (x[prev] - avg_x) * (y[start:end] - y[prev])
+            - (x[prev] - x[start:end]) * (avg_y - y[prev])
+        )
+        prev = start + int(area.argmax())
+        selected[i + 1] = prev
+
+    return selected
 
 # === Streamlit Layout ===
 st.title("📍 NYC Neighborhood Complaint Index (NCI) (Neo4j Live)")
 
+# ZIP list, raw records, trend and Top Boroughs come from the snapshot when one is in use
+if snapshot_path and os.path.exists(snapshot_path):
+    snapshot_time = datetime.fromtimestamp(os.path.getmtime(snapshot_path))
+    st.caption(
+        f"Base data from snapshot `{snapshot_path}` saved {snapshot_time:%Y-%m-%d %H:%M}; "
+        "delete the file to refresh it from Neo4j."
+    )
+
 # Sidebar filter
 with st.sidebar:
     st.header("Filter Options")
-    zip_codes = df['Incident_zip'].dropna().unique()
-    selected_zip = st.selectbox("Select ZIP Code", sorted(zip_codes))
+    selected_zip = st.selectbox("Select ZIP Code", get_zip_codes(df))
 
 # Filtered Data
-filtered_df = df[df['Incident_zip'] == selected_zip]
+filtered_df = zip_groups[selected_zip]
 
 st.subheader(f"Complaint Summary for ZIP {selected_zip}")
 
-# Complaint counts
-complaint_counts = filtered_df['Complaint_type'].value_counts().reset_index()
-complaint_counts.columns = ['Complaint Type', 'Count']
-
 # === Visualization Options ===
 st.markdown("## 📊 Complaint Visualizations")
 
@@ -83,63 +276,97 @@ viz_option = st.selectbox(
     ["Bar Chart", "Pie Chart", "Sunburst Chart", "Complaint Trend Over Time", "Top Boroughs (Overall)"]
 )
 
-if viz_option == "Bar Chart":
-    fig = px.bar(
-        complaint_counts,
-        x="Complaint Type", y="Count",
-        title="Complaint Types Distribution",
-        labels={"Count": "Number of Complaints"},
-        height=500
-    )
-    st.plotly_chart(fig, use_container_width=True)
-
-elif viz_option == "Pie Chart":
-    fig = px.pie(
-        complaint_counts,
-        names="Complaint Type", values="Count",
-        title="Complaint Types Distribution",
-        height=500
-    )
-    st.plotly_chart(fig, use_container_width=True)
-
-elif viz_option == "Sunburst Chart":
-    fig = px.sunburst(
-        filtered_df,
-        path=["Borough", "Complaint_type"],
-        title="Complaint Breakdown: Borough ➔ Complaint Type",
-        height=600
-    )
-    st.plotly_chart(fig, use_container_width=True)
-
-elif viz_option == "Complaint Trend Over Time":
-    daily_trend = filtered_df.set_index('Created_date').resample('W').size().reset_index(name='count')
-    fig = px.line(
-        daily_trend,
-        x="Created_date", y="count",
-        title="Complaint Trend Over Time (Weekly Aggregated)",
-        labels={"Created_date": "Date", "count": "Number of Complaints"},
-        markers=True
-    )
-    st.plotly_chart(fig, use_container_width=True)
-
-elif viz_option == "Top Boroughs (Overall)":
-    borough_counts = df['Borough'].value_counts().reset_index()
-    borough_counts.columns = ['Borough', 'Count']
-    fig = px.bar(
-        borough_counts,
-        x="Borough", y="Count",
-        title="Top Boroughs by Total Complaint Volume",
-        height=500
-    )
-    st.plotly_chart(fig, use_container_width=True)
+# === Figure construction, cached as a shared Figure object per ZIP and visualization ===
+# cache_resource hands back the same Figure without pickling; the TTL matches the Neo4j query caches
+@st.cache_resource(ttl=600, show_spinner=False)
+def build_figure(viz_option, selected_zip):
+    import plotly.graph_objects as go
+
+    complaint_counts = get_complaint_counts(selected_zip)
+
+    if viz_option == "Bar Chart":
+        fig = go.Figure(go.Bar(
+            x=complaint_counts["Complaint Type"].to_numpy(),
+            y=complaint_counts["Count"].to_numpy()
+        ))
+        fig.update_layout(
+            title="Complaint Types Distribution",
+            xaxis_title="Complaint Type", yaxis_title="Number of Complaints",
+            height=500
+        )
+
+    elif viz_option == "Pie Chart":
+        fig = go.Figure(go.Pie(
+            labels=complaint_counts["Complaint Type"].to_numpy(),
+            values=complaint_counts["Count"].to_numpy()
+        ))
+        fig.update_layout(title="Complaint Types Distribution", height=500)
+
+    elif viz_option == "Sunburst Chart":
+        breakdown = get_borough_breakdown(selected_zip)
+        borough_totals = breakdown.groupby("Borough", observed=True)["count"].sum()
+        fig = go.Figure(go.Sunburst(
+            ids=np.concatenate([borough_totals.index.to_numpy(), (breakdown["Borough"] + "/" + breakdown["Complaint_type"]).to_numpy()]),
+            labels=np.concatenate([borough_totals.index.to_numpy(), breakdown["Complaint_type"].to_numpy()]),
+            parents=np.concatenate([np.full(len(borough_totals), ""), breakdown["Borough"].to_numpy()]),
+            values=np.concatenate([borough_totals.to_numpy(), breakdown["count"].to_numpy()]),
+            branchvalues="total"
+        ))
+        fig.update_layout(title="Complaint Breakdown: Borough ➔ Complaint Type", height=600)
+
+    elif viz_option == "Complaint Trend Over Time":
+        zip_weekly = weekly_by_zip(df)[selected_zip]
+        active = np.flatnonzero(zip_weekly.to_numpy())
+        if len(active):
+            zip_weekly = zip_weekly.iloc[active[0]:active[-1] + 1]  # trim weeks outside this ZIP's range
+        daily_trend = zip_weekly.rename_axis('Created_date').reset_index(name='count')
+        keep = lttb_downsample(
+            daily_trend['Created_date'].to_numpy().astype('int64').astype('float64'),
+            daily_trend['count'].to_numpy().astype('float64')
+        )
+        daily_trend = daily_trend.iloc[keep]
+
+        import plotly.express as px
+        fig = px.line(
+            daily_trend,
+            x="Created_date", y="count",
+            title="Complaint Trend Over Time (Weekly Aggregated)",
+            labels={"Created_date": "Date", "count": "Number of Complaints"},
+            markers=True,
+            render_mode="webgl"
+        )
+
+    elif viz_option == "Top Boroughs (Overall)":
+        borough_counts = get_borough_counts(df)
+        fig = go.Figure(go.Bar(
+            x=borough_counts["Borough"].to_numpy(),
+            y=borough_counts["Count"].to_numpy()
+        ))
+        fig.update_layout(
+            title="Top Boroughs by Total Complaint Volume",
+            xaxis_title="Borough", yaxis_title="Count",
+            height=500
+        )
+
+    # Keep zoom/pan state stable across Streamlit reruns
+    fig.update_layout(uirevision="fixed")
+    return fig
+
+st.plotly_chart(build_figure(viz_option, selected_zip), use_container_width=True)
 
 # === Raw Data Table ===
 st.subheader("📄 Raw Complaint Records")
-st.dataframe(filtered_df)
+
+# Only send one page of rows to the browser per rerun
+page_size = 100
+max_pages = max(1, -(-len(filtered_df) // page_size))
+page = st.number_input("Page", min_value=1, max_value=max_pages, value=1, step=1)
+st.caption(f"Showing page {page} of {max_pages} ({len(filtered_df)} records)")
+st.dataframe(filtered_df.iloc[(page - 1) * page_size : page * page_size])
 
 st.download_button(
     label="📥 Download Filtered Data as CSV",
-    data=filtered_df.to_csv(index=False),
+    data=to_csv_bytes(selected_zip),
     file_name=f"complaints_{selected_zip}.csv",
     mime="text/csv"
 )
@@ -150,21 +377,6 @@ st.subheader("🌐 Complaint Network Graph (Neo4j)")
 graph_data = get_zip_graph_data(selected_zip)
 
 if graph_data:
-    g = Network(height="400px", width="100%", notebook=False)
-    g.add_node(selected_zip, label=f"ZIP: {selected_zip}", color="blue")
-    for zip_code, complaint_type, count in graph_data:
-        g.add_node(complaint_type, label=complaint_type, color="orange")
-        g.add_edge(zip_code, complaint_type, value=count, title=f"{count} complaints")
-
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".html") as tmp_file:
-        g.show(tmp_file.name)
-        HtmlFile = open(tmp_file.name, 'r', encoding='utf-8')
-        components.html(HtmlFile.read(), height=450)
-        HtmlFile.close()
-        os.remove(tmp_file.name)
+    components.html(build_graph_html(selected_zip, graph_data), height=450)
 else:
     st.warning("⚠️ No graph data available for this ZIP code in Neo4j.")
-
-# === Safe Neo4j Closing ===
-session.close()
-driver.close()